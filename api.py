@@ -1,22 +1,36 @@
+import asyncio
+from collections import Counter
 from contextlib import asynccontextmanager
+from datetime import timedelta
+from time import monotonic
 from typing import Dict, Any
-from fastapi import FastAPI, HTTPException, Query
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from fastapi import FastAPI, HTTPException, Query, Request
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from src.blobs import BlobStore
 from src.config import config
+from src.jobs import API_TRANSITIONS, DEFAULT_TARGETS, STATUS_GENERATING, STATUS_QUARANTINED, STATUS_QUEUED, can_transition
 from src.log import logger
+from src.resources import Resources
+from src.scheduler import lease_time, priority_expression
 from src.types import *
 
 # MongoDB
+resources = Resources('api')
 collection: AsyncIOMotorCollection | None = None
+blobs: BlobStore | None = None
+
+# 看板统计缓存
+stats_cache: Dict[str, Any] = {"data": None, "expires": 0.0}
+stats_lock = asyncio.Lock()
 
 @asynccontextmanager
 async def lifespan(use_app: FastAPI):
     # Startup
-    global collection
+    global collection, blobs
     try:
-        client = AsyncIOMotorClient(config.MONGODB_URL)
-        db = client.get_database(config.DATABASE_NAME)
-        collection = db.get_collection(config.COLLECTION_NAME)
+        collection = resources.collection()
+        blobs = BlobStore.from_db(resources.db)
         logger.info("Connected to MongoDB successfully")
 
         # 创建索引
@@ -32,27 +46,169 @@ async def lifespan(use_app: FastAPI):
     yield
 
     # Shutdown
-    if client:
-        client.close()
-        logger.info("MongoDB connection closed")
+    await resources.close()
+
+
+def queue_fields(boost: Optional[float], deadline: Optional[datetime]) -> Dict[str, Any]:
+    """
+    入队时写入的调度字段，用于聚合管道更新（$set 阶段），重新入队会清零尝试次数
+    - 优先级在服务端按文档的 hot、create_time 计算，不需要先读取文档
+    - boost 为 None 时沿用原有的加权
+    """
+    now = datetime.now()
+    fields: Dict[str, Any] = {
+        "boost": {"$ifNull": ["$boost", 0]} if boost is None else boost,
+        "priority": priority_expression(boost, now),
+        "attempts": 0,
+        "queued_at": now,
+        # 重新提交时丢弃上次中断留下的检查点
+        "partial_result": {"$literal": {}},
+    }
+    if deadline is not None:
+        fields["deadline"] = deadline
+    return fields
+
+
+# 入队时清除上次失败的原因，以及旧版本批量控制遗留的标记
+QUEUE_UNSET = ["last_error", "control_token"]
 
 
 # 初始化FastAPI应用
 app = FastAPI(lifespan=lifespan)
 
 
+@app.middleware("http")
+async def limit_concurrency(http_request: Request, call_next):
+    """同时处理的请求数不超过 API_CONCURRENCY，与连接池大小一致；健康检查不受限制"""
+    if http_request.url.path == "/health":
+        return await call_next(http_request)
+    async with resources.limit():
+        return await call_next(http_request)
+
+
+@app.get("/health")
+async def health():
+    """
+    健康检查
+    """
+    status = await resources.health()
+    if not status["mongodb"]:
+        raise HTTPException(status_code=503, detail="MongoDB unavailable")
+    return {"code": 200, "message": "OK", "data": status}
+
+
+# 列表只返回 CreationRowInfo 中的字段，避免加载表单、生成结果等大字段
+LIST_PROJECTION = {field.alias or name: 1 for name, field in CreationRowInfo.model_fields.items()}
+
+
+async def find_collapsed_items(query: Dict[str, Any], skip: int, size: int):
+    """
+    按话题折叠后分页，总数与当前页在一次聚合中返回
+    - 排序和分组前只保留列表字段，减小内存占用
+    - 匹配的数据量较大时允许排序/分组溢出到磁盘
+    """
+    pipeline = [
+        {"$match": query},
+        {"$project": LIST_PROJECTION},
+        {"$sort": {"create_time": -1}},
+        {"$group": {"_id": {"$ifNull": ["$cluster_id", "$_id"]}, "item": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$item"}},
+        {"$sort": {"create_time": -1}},
+        {"$facet": {
+            "items": [{"$skip": skip}, {"$limit": size}],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+    facets = await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+    facet = facets[0] if facets else {"items": [], "total": []}
+    total = facet["total"][0]["count"] if facet["total"] else 0
+    return total, facet["items"]
+
+
+async def aggregate_stats() -> CreationStats:
+    """一次 $facet 聚合得到看板所需的全部统计"""
+    now = datetime.now()
+    pipeline = [
+        {"$match": {"del_flag": False}},
+        {"$facet": {
+            "counts": [
+                {"$group": {"_id": {"status": "$status", "source": "$source"}, "count": {"$sum": 1}}},
+            ],
+            "queue": [
+                {"$match": {"status": {"$in": [STATUS_QUEUED, STATUS_GENERATING]}}},
+                {"$group": {
+                    "_id": "$status",
+                    "count": {"$sum": 1},
+                    "oldest": {"$min": {"$ifNull": ["$queued_at", "$create_time"]}},
+                }},
+            ],
+            "latency": [
+                {"$match": {
+                    "generated_at": {"$gte": now - timedelta(hours=config.STATS_LATENCY_WINDOW_HOURS)},
+                    "claimed_at": {"$exists": True},
+                }},
+                {"$group": {"_id": None, "avg_ms": {"$avg": {"$subtract": ["$generated_at", "$claimed_at"]}}}},
+            ],
+        }},
+    ]
+    facets = await collection.aggregate(pipeline).to_list(length=1)
+    facet = facets[0] if facets else {"counts": [], "queue": [], "latency": []}
+
+    queue = {row["_id"]: row for row in facet["queue"]}
+    pending = queue.get(STATUS_QUEUED, {})
+    oldest = pending.get("oldest")
+    avg_ms = facet["latency"][0]["avg_ms"] if facet["latency"] else None
+    return CreationStats(
+        counts=[
+            StatusSourceCount(status=row["_id"].get("status") or 0, source=row["_id"].get("source") or "", count=row["count"])
+            for row in facet["counts"]
+        ],
+        queue_depth=pending.get("count", 0),
+        generating=queue.get(STATUS_GENERATING, {}).get("count", 0),
+        avg_generate_seconds=round(avg_ms / 1000, 1) if avg_ms is not None else None,
+        oldest_pending_seconds=round((now - oldest).total_seconds(), 1) if oldest else None,
+        updated_at=now
+    )
+
+
+@app.get("/stats", response_model=CreationStatsResponse)
+async def get_stats():
+    """
+    看板统计
+    - 按 status × source 计数、排队数量、最早排队数据的等待时长、平均生成耗时
+    - 结果缓存 STATS_CACHE_SECONDS 秒，并发请求共用同一次聚合
+    """
+    try:
+        async with stats_lock:
+            if stats_cache["data"] is None or monotonic() >= stats_cache["expires"]:
+                stats_cache["data"] = await aggregate_stats()
+                stats_cache["expires"] = monotonic() + config.STATS_CACHE_SECONDS
+            data = stats_cache["data"]
+        return CreationStatsResponse(
+            code=200,
+            message="OK",
+            data=data
+        )
+
+    except Exception as e:
+        logger.error(f"Error fetching stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @app.get("/items", response_model=CreationDataResponse)
 async def get_items(
         page: int = Query(1, ge=1, description="Page number"),
         size: int = Query(20, ge=1, le=100, description="Page size"),
         status: Optional[int] = Query(0, description="Filter by status"),
-        source: Optional[str] = Query(None, description="Filter by source")
+        source: Optional[str] = Query(None, description="Filter by source"),
+        collapse: bool = Query(False, description="One row per topic cluster")
 ):
     """
     获取创建项列表
     - 默认按 create_time 降序排列（从新到旧）
     - 默认只查询未删除的数据 (del_flag=False)
     - 支持按 status 和 source 过滤
+    - collapse=true 时同一话题（cluster_id）只返回最新的一条
     """
     try:
         # 构建查询条件
@@ -67,11 +223,15 @@ async def get_items(
         # 计算分页
         skip = (page - 1) * size
 
-        # 获取总数
-        total = await collection.count_documents(query)
-        # 查询数据
-        cursor = collection.find(query).sort("create_time", -1).skip(skip).limit(size)
-        items = await cursor.to_list(length=size)
+        if collapse:
+            total, items = await find_collapsed_items(query, skip, size)
+        else:
+            # 获取总数
+            total = await collection.count_documents(query)
+            # 查询数据
+            # 列表不需要表单和生成结果，避免加载大字段
+            cursor = collection.find(query, LIST_PROJECTION).sort("create_time", -1).skip(skip).limit(size)
+            items = await cursor.to_list(length=size)
         logger.info(f"Found {len(items)} items")
         response_data = CreationData(
             items=items,
@@ -101,14 +261,19 @@ async def get_info_by_id(creation_id: str):
         if not item:
             raise HTTPException(status_code=404, detail="Item not found")
         item = dict(item)
-        item_result = item.get('result', {})
+        item_result = await blobs.resolve(item.get('result', {}))
+        result_fields = item.get('result_fields', {})
         format_results = []
-        if item_result:
-            for k, v in item_result.items():
-                format_results.append({
-                    "to": k,
-                    "content": v
-                })
+        for k in item.get('result', {}):
+            if k not in item_result:
+                # 分离存储的内容已丢失，标记出来而不是整条报错
+                format_results.append({"to": k, "content": "", "issues": ["内容已丢失，请重新生成"]})
+                continue
+            format_results.append({
+                "to": k,
+                "content": item_result[k],
+                **result_fields.get(k, {})
+            })
         item['result'] = format_results
         return CreationDataResponse(
             code=200,
@@ -133,6 +298,10 @@ async def get_generate_form_by_id(creation_id: str):
         if not item:
             raise HTTPException(status_code=404, detail="Item not found")
         item = dict(item)
+        if item.get('formForGenerate'):
+            item['formForGenerate'] = await blobs.resolve(item['formForGenerate'])
+            # 分离存储的 html 已丢失时返回空内容，由编辑重新填写
+            item['formForGenerate'].setdefault('html', '')
         return CreationDataResponse(
             code=200,
             message="OK",
@@ -155,15 +324,14 @@ async def submit_generate(request: CreationGenerateFormUpdateRequest):
         # 转换字符串ID为ObjectId
         object_id = ObjectId(request.id)
 
-        # 执行批量更新
+        update = {
+            "status": 1,
+            "formForGenerate": {"$literal": await blobs.offload(request.form.model_dump())},
+            **queue_fields(request.boost, request.deadline)
+        }
         result = await collection.update_one(
             {"_id": object_id},
-            {"$set":
-                {
-                    "status": 1,
-                    "formForGenerate": request.form.model_dump()
-                }
-            }
+            [{"$set": update}, {"$unset": QUEUE_UNSET}]
         )
 
         if result.matched_count == 0:
@@ -275,6 +443,158 @@ async def update_items_delete(request: IdsUpdateRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def control_failure(job: JobControlItem, doc: Optional[Dict[str, Any]]) -> JobControlResult:
+    """根据更新后的文档判断批量控制中某个ID未命中的原因"""
+    if doc is None or doc.get("del_flag"):
+        return JobControlResult(id=job.id, ok=False, message="Item not found")
+    status = doc.get("status", 0)
+    if not can_transition(status, job.status, API_TRANSITIONS):
+        return JobControlResult(
+            id=job.id, ok=False, status=status, message=f"Illegal status transition {status} -> {job.status}"
+        )
+    if job.status == STATUS_QUEUED and job.form is None and not doc.get("formForGenerate"):
+        return JobControlResult(id=job.id, ok=False, status=status, message="Missing form")
+    return JobControlResult(id=job.id, ok=False, status=status, message="Item changed concurrently")
+
+
+@app.put("/creations/batch_control")
+async def batch_control(request: JobControlRequest):
+    """
+    批量任务控制：按ID分别提交表单/目标平台并流转status
+    - 不预先读取，一次 bulk_write 完成全部更新；仅在有ID未命中时再读取一次以给出原因
+    - 服务端校验状态流转（作为更新条件），API 只允许 0→1、1→0、3→4、5→1
+    - 返回每个ID的处理结果
+    """
+    try:
+        results: Dict[str, JobControlResult] = {}
+        wanted: Dict[ObjectId, JobControlItem] = {}
+        counts = Counter(job.id for job in request.items)
+        for job in request.items:
+            if counts[job.id] > 1:
+                results[job.id] = JobControlResult(id=job.id, ok=False, message="Duplicate id in request")
+                continue
+            if not ObjectId.is_valid(job.id):
+                results[job.id] = JobControlResult(id=job.id, ok=False, message="Invalid id")
+                continue
+            if job.targets is not None:
+                unknown = [t for t in job.targets if t not in DEFAULT_TARGETS]
+                if not job.targets or unknown:
+                    results[job.id] = JobControlResult(id=job.id, ok=False, message=f"Invalid targets: {unknown}")
+                    continue
+            wanted[ObjectId(job.id)] = job
+
+        # 大字段分离存储，只有表单超过阈值时才需要额外一次写入
+        with_form = [job for job in wanted.values() if job.form is not None]
+        forms = dict(zip(
+            (job.id for job in with_form),
+            await blobs.offload_many([job.form.model_dump() for job in with_form])
+        ))
+
+        # 状态流转、表单是否存在都作为更新条件，优先级在服务端计算，无需先读取
+        # status_changed_at 精确到毫秒，未命中时据此区分是否由本次请求写入
+        changed_at = lease_time()
+        operations = []
+        for object_id, job in wanted.items():
+            sources = [status for status, targets in API_TRANSITIONS.items() if job.status in targets]
+            query: Dict[str, Any] = {"_id": object_id, "del_flag": False, "status": {"$in": sources}}
+            fields: Dict[str, Any] = {"status": job.status, "status_changed_at": changed_at}
+            if job.id in forms:
+                fields["formForGenerate"] = {"$literal": forms[job.id]}
+            elif job.status == STATUS_QUEUED:
+                query["formForGenerate"] = {"$nin": [None, {}]}
+            if job.targets is not None:
+                fields["targets"] = {"$literal": job.targets}
+            if job.status == STATUS_QUEUED:
+                fields.update(queue_fields(job.boost, job.deadline))
+            unset = QUEUE_UNSET if job.status == STATUS_QUEUED else ["control_token"]
+            operations.append(UpdateOne(query, [{"$set": fields}, {"$unset": unset}]))
+            results[job.id] = JobControlResult(id=job.id, ok=True, status=job.status)
+
+        modified = 0
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            modified = result.modified_count
+            if result.matched_count < len(operations):
+                # 只有部分未命中时才读取一次，逐个给出原因
+                current = {
+                    doc["_id"]: doc async for doc in collection.find(
+                        {"_id": {"$in": list(wanted.keys())}},
+                        {"status": 1, "del_flag": 1, "status_changed_at": 1, "formForGenerate.type": 1}
+                    )
+                }
+                for object_id, job in wanted.items():
+                    doc = current.get(object_id)
+                    if doc is not None and doc.get("status_changed_at") == changed_at:
+                        continue
+                    results[job.id] = control_failure(job, doc)
+                logger.warning(f"Batch control: {len(operations) - result.matched_count} items not updated")
+
+        return {
+            "code": 200,
+            "message": f"Successfully updated status for {modified} items",
+            "data": [results[item_id].model_dump() for item_id in counts]
+        }
+
+    except Exception as e:
+        logger.error(f"Error applying batch control: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.get("/creations/quarantine", response_model=CreationDataResponse)
+async def get_quarantined_items(
+        page: int = Query(1, ge=1, description="Page number"),
+        size: int = Query(20, ge=1, le=100, description="Page size")
+):
+    """
+    获取被隔离的数据（多次生成失败）
+    - 按最近一次失败时间降序排列
+    """
+    try:
+        query = {"status": STATUS_QUARANTINED, "del_flag": False}
+        skip = (page - 1) * size
+        total = await collection.count_documents(query)
+        cursor = collection.find(query, LIST_PROJECTION).sort("last_failed_at", -1).skip(skip).limit(size)
+        items = await cursor.to_list(length=size)
+        return CreationDataResponse(
+            code=200,
+            message="OK",
+            data=CreationData(items=items, total=total, page=page, size=size)
+        )
+
+    except Exception as e:
+        logger.error(f"Error fetching quarantined items: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.put("/creations/requeue")
+async def requeue_items(request: IdsUpdateRequest):
+    """
+    将被隔离的数据重新排队，尝试次数清零
+    - 按热度、新鲜度和原有加权重新计算优先级，撤销失败时的降权
+    """
+    try:
+        object_ids = [ObjectId(item_id) for item_id in request.ids]
+
+        result = await collection.update_many(
+            {"_id": {"$in": object_ids}, "status": STATUS_QUARANTINED},
+            [{"$set": {"status": STATUS_QUEUED, **queue_fields(None, None)}}, {"$unset": QUEUE_UNSET}]
+        )
+
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="No quarantined items found to requeue")
+
+        return {
+            'code': 200,
+            "message": f"Successfully requeued {result.modified_count} items"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error requeueing items: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @app.delete("/items/{item_id}")
 async def delete_item_permanently(item_id: str):
     """
@@ -1,23 +1,28 @@
-import uuid
 from datetime import datetime
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 import asyncio
 import aiohttp
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import BulkWriteError
 
+from src.blobs import BlobStore
+from src.cluster import ClusterIndex, load_cluster_index, refresh_cluster_stats, topic_text
 from src.config import config
 from src.log import logger
-from src.types import CreationItem
+from src.resources import Resources
+from src.types import CreationItemList
 
+# 按数量级区分秒 / 毫秒 / 微秒 / 纳秒时间戳（10 / 13 / 16 / 19 位）
+TIMESTAMP_UNITS = ((10 ** 18, 10 ** 9), (10 ** 15, 10 ** 6), (10 ** 12, 10 ** 3), (0, 1))
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+DUPLICATE_KEY_ERROR = 11000
 
-async def get_all_routes() -> Dict[str, str]:
+
+async def get_all_routes(session: aiohttp.ClientSession) -> Dict[str, str]:
     """获取所有可用的路由"""
     url = f'{config.DAILY_HOT_API_BASE_URL}/all'
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, ssl=False) as response:
-            data = await response.json()
+    async with session.get(url, ssl=False) as response:
+        data = await response.json()
 
     code = data.get('code', 500)
     useful_routes = {
@@ -72,8 +77,21 @@ async def get_all_routes() -> Dict[str, str]:
     return useful_routes
 
 
-async def get_top_data_by_path(session: aiohttp.ClientSession, path: str, source: str) -> List[CreationItem]:
-    """根据路径获取热门数据"""
+def normalize_timestamp(timestamp: Any) -> Optional[str]:
+    """将 10/13/16/19 位的数字时间戳转为时间字符串，其余值原样返回"""
+    if not isinstance(timestamp, (int, float)):
+        return timestamp
+    for bound, divisor in TIMESTAMP_UNITS:
+        if abs(timestamp) >= bound:
+            try:
+                return datetime.fromtimestamp(timestamp // divisor).strftime(TIMESTAMP_FORMAT)
+            except (OverflowError, OSError, ValueError):
+                return None
+    return None
+
+
+async def get_top_data_by_path(session: aiohttp.ClientSession, path: str, source: str) -> List[Dict[str, Any]]:
+    """根据路径获取热门数据，返回可直接写入 MongoDB 的字典"""
     url = f'{config.DAILY_HOT_API_BASE_URL}{path}'
     logger.debug(f'url: {url}')
 
@@ -82,113 +100,129 @@ async def get_top_data_by_path(session: aiohttp.ClientSession, path: str, source
             data = await response.json()
 
         code = data.get('code', 500)
-        result = []
-
-        if code == 200:
-            logger.debug(f'data: {data}')
-            top_data = data.get('data', [])
-
-            for top in top_data:
-                top_id = top.get('id', None)
-                if top_id:
-                    top['_id'] = uuid.uuid4().hex
-                    top.pop('id')
-                    top['source'] = source
-                    top['create_time'] = datetime.now()
-                    top['top_id'] = str(top_id)
-
-                    # 处理时间戳
-                    timestamp = top.get('timestamp', None)
-                    if isinstance(timestamp, int):
-                        timestamp_str = str(timestamp)
-                        if len(timestamp_str) == 13:
-                            timestamp_s = int(timestamp_str[:10])
-                            timestamp_dt = datetime.fromtimestamp(timestamp_s)
-                            timestamp_str = timestamp_dt.strftime('%Y-%m-%d %H:%M:%S')
-                        elif len(timestamp_str) == 19:
-                            timestamp_str = None
-                        else:
-                            timestamp_dt = datetime.fromtimestamp(timestamp)
-                            timestamp_str = timestamp_dt.strftime('%Y-%m-%d %H:%M:%S')
-                        top['timestamp'] = timestamp_str
-
-                    result.append(CreationItem(**top))
-
-        return result
+        if code != 200:
+            return []
+
+        logger.debug(f'data: {data}')
+        create_time = datetime.now()
+        rows = [
+            {
+                **top,
+                'source': source,
+                'top_id': str(top['id']),
+                'create_time': create_time,
+                'timestamp': normalize_timestamp(top.get('timestamp')),
+            }
+            for top in data.get('data', [])
+            if top.get('id')
+        ]
+        # 整批校验后一次性导出为字典
+        return CreationItemList.dump_python(CreationItemList.validate_python(rows))
 
     except Exception as e:
         logger.error(f"Error fetching data from {url}: {e}")
         return []
 
 
-async def save_to_mongodb(collection, top_items: List[CreationItem]):
-    """将数据保存到 MongoDB"""
+async def save_to_mongodb(collection, top_items: List[Dict[str, Any]]):
+    """将数据批量保存到 MongoDB，已存在的数据（source + top_id 重复）跳过"""
     if not top_items:
         return
-    for item in top_items:
-        try:
-            result = await collection.insert_one(item.model_dump())
-            if result.inserted_id:
-                logger.info(f"Successfully inserted 1 documents into MongoDB")
-        except DuplicateKeyError as e:
-            logger.warning(f"Failure saving to MongoDB: {e}")
-        except Exception as e:
-            logger.error(f"Error saving to MongoDB: {e}")
-
-
-async def process_single_source(session: aiohttp.ClientSession, collection, source: str, path: str):
-    """处理单个数据源"""
+    try:
+        result = await collection.insert_many(top_items, ordered=False)
+        logger.info(f"Successfully inserted {len(result.inserted_ids)} documents into MongoDB")
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        duplicates = sum(1 for error in errors if error.get('code') == DUPLICATE_KEY_ERROR)
+        logger.info(f"Successfully inserted {e.details.get('nInserted', 0)} documents into MongoDB, "
+                    f"skipped {duplicates} duplicates")
+        if len(errors) > duplicates:
+            logger.error(f"Error saving to MongoDB: {[error for error in errors if error.get('code') != DUPLICATE_KEY_ERROR]}")
+    except Exception as e:
+        logger.error(f"Error saving to MongoDB: {e}")
+
+
+async def fetch_single_source(session: aiohttp.ClientSession, source: str, path: str,
+                              semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    """抓取单个数据源"""
     if path is None:
         logger.warning(f"No path found for source: {source}")
-        return
+        return []
 
     logger.info(f"Processing source: {source}")
-    top_data = await get_top_data_by_path(session, path, source)
+    async with semaphore:
+        top_data = await get_top_data_by_path(session, path, source)
 
     if top_data:
         logger.debug(f"Found {len(top_data)} items for {source}")
-        await save_to_mongodb(collection, top_data)
     else:
         logger.warning(f"No data found for source: {source}")
+    return top_data
+
+
+async def save_single_source(collection, top_data: List[Dict[str, Any]], semaphore: asyncio.Semaphore):
+    """保存单个数据源"""
+    async with semaphore:
+        await save_to_mongodb(collection, top_data)
+
+
+def assign_clusters(index: ClusterIndex, top_items: List[Dict[str, Any]]):
+    """为本次抓取的数据分配话题 cluster_id，跨数据源的近似重复标题归为同一话题"""
+    for item in top_items:
+        item['cluster_id'] = index.add(f"{item['source']}:{item['top_id']}", topic_text(item['title'], item.get('desc')))
 
 
 async def main():
     """主函数"""
 
-    # 创建 MongoDB 连接
-    client = AsyncIOMotorClient(config.MONGODB_URL)
-    db = client[config.DATABASE_NAME]
-    collection = db[config.COLLECTION_NAME]
+    # 同一个进程共用一个 MongoDB 连接池和 HTTP 会话
+    async with Resources('crawler') as resources:
+        collection = resources.collection()
+        session = await resources.http()
+
+        # 创建索引
+        await create_indexes(collection)
 
-    try:
         # 获取所有路由
-        routes = await get_all_routes()
+        routes = await get_all_routes(session)
         logger.debug(f"Available routes: {routes}")
 
         keys_to_process = list(routes.keys())
         logger.debug(f"Processing keys: {keys_to_process}")
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for key in keys_to_process:
-                # 如果只想处理特定源，可以取消下面的注释
-                # if key != 'hupu':
-                #     continue
-                path = routes[key]
-                task = process_single_source(session, collection, key, path)
-                tasks.append(task)
-
-            await asyncio.gather(*tasks, return_exceptions=True)
-    finally:
-        # 关闭 MongoDB 连接
-        client.close()
-
-
-async def create_indexes():
+        # 并发抓取的数据源数量与连接池大小一致
+        semaphore = asyncio.Semaphore(resources.concurrency)
+        tasks = []
+        for key in keys_to_process:
+            # 如果只想处理特定源，可以取消下面的注释
+            # if key != 'hupu':
+            #     continue
+            path = routes[key]
+            task = fetch_single_source(session, key, path, semaphore)
+            tasks.append(task)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = [top_data for top_data in results if isinstance(top_data, list) and top_data]
+
+        # 用近期数据重建话题索引，再加入本次抓取的数据
+        index = await load_cluster_index(collection, config.CLUSTER_WINDOW_HOURS)
+        for top_data in results:
+            assign_clusters(index, top_data)
+        logger.info(f"Clustered {sum(len(top_data) for top_data in results)} items into {len(index.touched)} touched topics")
+
+        await asyncio.gather(
+            *[save_single_source(collection, top_data, semaphore) for top_data in results],
+            return_exceptions=True
+        )
+        await refresh_cluster_stats(collection, index.touched)
+
+        # 定时任务顺带清理不再被引用的分离存储内容
+        if config.BLOB_STORAGE_ENABLED:
+            await BlobStore.from_db(resources.db).sweep(collection, config.BLOB_SWEEP_GRACE_SECONDS)
+
+
+async def create_indexes(collection):
     """创建数据库索引（幂等操作）"""
-    client = AsyncIOMotorClient(config.MONGODB_URL)
-    db = client[config.DATABASE_NAME]
-    collection = db[config.COLLECTION_NAME]
     existing_indexes = await collection.list_indexes().to_list(length=None)
     existing_index_names = [index["name"] for index in existing_indexes]
 
@@ -210,6 +244,10 @@ async def create_indexes():
     if "del_flag_1" not in existing_index_names:
         indexes_to_create.append([("del_flag", 1)])
 
+    # 检查话题索引是否存在
+    if "cluster_id_1" not in existing_index_names:
+        indexes_to_create.append([("cluster_id", 1)])
+
     # 创建缺失的索引
     for index_spec in indexes_to_create:
         if len(index_spec) == 2 and isinstance(index_spec[0], tuple):
@@ -232,8 +270,4 @@ async def create_indexes():
 
 
 if __name__ == '__main__':
-    # 创建索引
-    asyncio.run(create_indexes())
-
-    # 运行主程序
     asyncio.run(main())
\ No newline at end of file
@@ -1,31 +1,193 @@
 import asyncio
-from bson import ObjectId
-from langchain_openai import ChatOpenAI
-from motor.motor_asyncio import AsyncIOMotorClient
+import signal
+from datetime import datetime
+from src.blobs import BlobStore
 from src.config import config
+from src.jobs import DEFAULT_TARGETS, STATUS_GENERATING, STATUS_QUARANTINED, STATUS_QUEUED
 from src.log import logger
-from src.templates import hupu
+from src.postprocess import parse_content, postprocess
+from src.resources import Resources
+from src.scheduler import Scheduler, ensure_indexes, lease_time, migrate_priorities
 from src.types import FormForCreationGenerate
 
-chat = ChatOpenAI(
-    model="glm-4.5-flash",
-    base_url='https://open.bigmodel.cn/api/paas/v4'
-)
+
+class LeaseLost(Exception):
+    """租约已过期并被其他 worker 重新领取，本次生成结果作废"""
+
+
+def lease_filter(item: dict) -> dict:
+    """只有仍持有租约时才允许回写，避免与重新领取该数据的 worker 互相覆盖"""
+    return {"_id": item.get('_id'), "status": STATUS_GENERATING, "claimed_at": item.get('claimed_at')}
 
 
 async def generate_by_form(form: FormForCreationGenerate, to_key: str):
+    # langchain 较重，领取到第一条数据时再导入
+    from src.templates import hupu
+
     messages = hupu.get_template(to_key).invoke({'html': form.html, 'idea': form.idea})
 
-    response = chat.invoke(messages)
-    content = response.content
+    response = await Resources.chat().ainvoke(messages)
+    # 校验各段落格式，只修复不合格的段落
+    content, parsed = await postprocess(to_key, response.content)
+    if parsed.issues:
+        logger.warning(f"Generated {to_key} content still has issues: {parsed.issues}")
     return content
 
 
+async def generate_item(collection, blobs: BlobStore, item: dict):
+    object_id = item.get('_id', None)
+    form_data = item.get("formForGenerate", {})
+    result = item.get("result", {})
+    # 上次被中断时已生成的平台直接复用
+    partial = dict(item.get("partial_result") or {})
+    form = FormForCreationGenerate(**await blobs.resolve(form_data))
+    logger.info(f"Claimed One: {object_id} (source={item.get('source')}, priority={item.get('priority')})")
+    to_keys = item.get('targets') or DEFAULT_TARGETS
+    for to_key in to_keys:
+        if to_key in partial:
+            logger.debug(f"Reusing checkpoint for {to_key}")
+            continue
+        logger.debug(f"Generating for {to_key}")
+        content = await generate_by_form(form, to_key)
+        # 每个平台生成后立即保存，停机或失败时不必重复消耗 token
+        partial.update(await blobs.offload({to_key: content}))
+        # 同时续租，生成耗时较长时不会被当作崩溃回收
+        claimed_at = lease_time()
+        checkpoint = await collection.update_one(
+            lease_filter(item),
+            {"$set": {f"partial_result.{to_key}": partial[to_key], "claimed_at": claimed_at}}
+        )
+        if checkpoint.matched_count == 0:
+            raise LeaseLost(f"Lease on {object_id} was lost")
+        item['claimed_at'] = claimed_at
+    result.update(partial)
+    # 结构化段落只从最终文本解析，不再调用模型
+    contents = await blobs.resolve(partial)
+    result_fields = {
+        f"result_fields.{to_key}": parse_content(to_key, content).model_dump()
+        for to_key, content in contents.items() if isinstance(content, str)
+    }
+    updated_result = await collection.update_one(
+        lease_filter(item),
+        {"$set":
+            {
+                "status": 3,
+                "generated_at": datetime.now(),
+                "result": await blobs.offload(result),
+                **result_fields
+            },
+            "$unset": {"partial_result": ""}
+        }
+    )
+    if updated_result.modified_count == 0:
+        logger.error(f"Failed to update {object_id}, lease may have expired")
+    else:
+        logger.debug(f"Updated {object_id}")
+
+
+async def record_failure(collection, item: dict, error: Exception):
+    """记录生成失败；尝试次数达到上限后隔离，不再被领取"""
+    object_id = item.get('_id')
+    attempts = item.get('attempts', 1)
+    quarantined = attempts >= config.MAX_GENERATE_ATTEMPTS
+    await collection.update_one(
+        lease_filter(item),
+        {
+            "$set": {
+                "status": STATUS_QUARANTINED if quarantined else STATUS_QUEUED,
+                "last_error": f"{type(error).__name__}: {error}"[:1000],
+                "last_failed_at": datetime.now()
+            },
+            # 失败后让出队首，避免反复抢占其它数据
+            "$inc": {"priority": -1}
+        }
+    )
+    if quarantined:
+        logger.error(f"Quarantined {object_id} after {attempts} attempts: {error}")
+    else:
+        logger.warning(f"Generation failed for {object_id} (attempt {attempts}/{config.MAX_GENERATE_ATTEMPTS}): {error}")
+
+
+async def release_lease(collection, item: dict):
+    """停机时将未完成的数据退回排队状态，本次不计入尝试次数"""
+    object_id = item.get('_id')
+    result = await collection.update_one(
+        lease_filter(item),
+        {"$set": {"status": STATUS_QUEUED}, "$inc": {"attempts": -1}, "$unset": {"claimed_at": ""}}
+    )
+    if result.modified_count:
+        logger.info(f"Released {object_id} back to the queue")
+
+
+def install_signal_handlers(stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows 不支持 add_signal_handler
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+
+
+async def sweep_leases(scheduler: Scheduler, collection, stop: asyncio.Event):
+    """定期回收其他 worker 崩溃后遗留的数据，与队列是否积压无关"""
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=config.WORKER_LEASE_SWEEP_INTERVAL)
+        except asyncio.TimeoutError:
+            try:
+                await scheduler.release_expired(collection, config.WORKER_LEASE_TIMEOUT, config.MAX_GENERATE_ATTEMPTS)
+            except Exception as e:
+                logger.error(f"Failed to release expired leases: {e}")
+
+
+async def run_item(collection, blobs: BlobStore, resources: Resources, item: dict, stop: asyncio.Event):
+    object_id = item.get('_id', None)
+    task = asyncio.create_task(generate_item(collection, blobs, item))
+    async with resources.track():
+        # 正常情况下等待生成完成；收到停机信号后最多再等待 WORKER_DRAIN_TIMEOUT 秒
+        stop_waiter = asyncio.create_task(stop.wait())
+        await asyncio.wait({task, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        stop_waiter.cancel()
+        if not task.done():
+            logger.info(f"Shutdown requested, waiting up to {config.WORKER_DRAIN_TIMEOUT}s for {object_id}")
+            await asyncio.wait({task}, timeout=config.WORKER_DRAIN_TIMEOUT)
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await release_lease(collection, item)
+        elif isinstance(task.exception(), LeaseLost):
+            # 数据已由其他 worker 接手，不计入本次失败
+            logger.warning(str(task.exception()))
+        elif task.exception() is not None:
+            await record_failure(collection, item, task.exception())
+
+
+async def worker_loop(scheduler: Scheduler, collection, blobs: BlobStore, resources: Resources, stop: asyncio.Event):
+    """逐条领取并生成；进程内同时运行 WORKER_CONCURRENCY 个"""
+    while not stop.is_set():
+        item = await scheduler.claim(collection)
+        if not item:
+            logger.debug("Queue is empty")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        object_id = item.get('_id', None)
+        if not item.get("formForGenerate"):
+            logger.warning(f"Item has no form: {object_id}")
+            # 已领取但缺少表单，退回待处理状态
+            await collection.update_one({"_id": object_id}, {"$set": {"status": 0}})
+            continue
+        await run_item(collection, blobs, resources, item, stop)
+
+
 async def main():
+    resources = Resources('worker')
     try:
-        client = AsyncIOMotorClient(config.MONGODB_URL)
-        db = client.get_database(config.DATABASE_NAME)
-        collection = db.get_collection(config.COLLECTION_NAME)
+        collection = resources.collection()
+        blobs = BlobStore.from_db(resources.db)
         logger.info("Connected to MongoDB successfully")
 
         # 创建索引
@@ -37,54 +199,25 @@ async def main():
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
         raise e
-    while True:
-        item = await collection.find_one(
-            {"status": 1, "source": 'hupu', "del_flag": False}
-        )
-        if not item:
-            logger.warning(f"Item not found: {item}")
-            await asyncio.sleep(10)
-            continue
-        object_id = item.get('_id', None)
-        form_data = item.get("formForGenerate", {})
-        result = item.get("result", {})
-        if not form_data or object_id is None:
-            logger.warning(f"Item not found: {item}")
-            await asyncio.sleep(10)
-            continue
-        form = FormForCreationGenerate(**form_data)
-        logger.info(f"Found One: {object_id}")
-        to_keys = ['kuaishou', 'red', 'bilibili', 'douyin']
-        updated_result = await collection.update_one(
-            {"_id": ObjectId(object_id)},
-            {"$set":
-                {
-                    "status": 2
-                }
-            }
-        )
-        if updated_result.modified_count == 0:
-            logger.warning(f"更新生成中状态失败")
-        else:
-            logger.debug(f"Updated status: 生成中")
-        for to_key in to_keys:
-            logger.debug(f"Generating for {to_key}")
-            content = await generate_by_form(form, to_key)
-            result[to_key] = content
-        updated_result = await collection.update_one(
-            {"_id": ObjectId(object_id)},
-            {"$set":
-                {
-                    "status": 3,
-                    "result": result
-                }
-            }
+    await ensure_indexes(collection)
+    await migrate_priorities(collection)
+    scheduler = Scheduler.from_config()
+    # 回收已崩溃的 worker 遗留的数据
+    await scheduler.release_expired(collection, config.WORKER_LEASE_TIMEOUT, config.MAX_GENERATE_ATTEMPTS)
+
+    stop = asyncio.Event()
+    install_signal_handlers(stop)
+    try:
+        # 同时处理的数据条数与连接池大小都由 WORKER_CONCURRENCY 决定
+        logger.info(f"Worker started with concurrency {resources.concurrency}")
+        await asyncio.gather(
+            sweep_leases(scheduler, collection, stop),
+            *[worker_loop(scheduler, collection, blobs, resources, stop) for _ in range(resources.concurrency)]
         )
-        if updated_result.modified_count == 0:
-            logger.error(f"Failed to update {object_id}")
-        else:
-            logger.debug(f"Updated {object_id}")
+    finally:
+        logger.info("Worker stopped")
+        await resources.close()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+import hashlib
+import zlib
+from datetime import datetime
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import Binary
+from pymongo import UpdateOne
+
+from src.config import config
+from src.log import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_ZSTD = 'zstd'
+CODEC_ZLIB = 'zlib'
+# 主文档中可能包含引用的字段，每个字段都是 {字段名: 值或引用} 的字典
+BLOB_FIELDS = ('formForGenerate', 'result', 'partial_result')
+# 清除阶段每批删除的数量，避免单个过滤条件过大
+SWEEP_BATCH_SIZE = 1000
+
+
+def is_ref(value: Any) -> bool:
+    """判断字段值是否为分离存储的引用"""
+    return isinstance(value, dict) and 'blob' in value
+
+
+def _compress(raw: bytes) -> tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(raw), CODEC_ZSTD
+    return zlib.compress(raw, 6), CODEC_ZLIB
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd compressed blobs")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class BlobStore:
+    """
+    大字段分离存储
+    - 内容按 sha256 寻址，相同内容只存一份
+    - 使用 zstd（未安装时退化为 zlib）压缩
+    - 主文档中只保留 {"blob": 哈希, "size": 原始字节数, "codec": 压缩方式}
+    """
+
+    def __init__(self, collection, enabled: bool = True, min_size: int = 4096):
+        self.collection = collection
+        self.enabled = enabled
+        self.min_size = min_size
+
+    @classmethod
+    def from_db(cls, db) -> 'BlobStore':
+        return cls(db.get_collection(config.BLOB_COLLECTION_NAME), config.BLOB_STORAGE_ENABLED, config.BLOB_MIN_SIZE)
+
+    async def offload(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """将超过阈值的字符串替换为引用，返回新的字典"""
+        return (await self.offload_many([values]))[0]
+
+    async def offload_many(self, values_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量版本的 offload，所有内容通过一次 bulk_write 写入"""
+        outputs = [dict(values) for values in values_list]
+        if not self.enabled:
+            return outputs
+        operations = {}
+        for output in outputs:
+            for key, value in output.items():
+                if not isinstance(value, str):
+                    continue
+                raw = value.encode('utf-8')
+                if len(raw) < self.min_size:
+                    continue
+                digest = hashlib.sha256(raw).hexdigest()
+                data, codec = _compress(raw)
+                # last_used 每次引用都会刷新，清理时据此跳过刚被引用的内容
+                operations[digest] = UpdateOne(
+                    {"_id": digest},
+                    {
+                        "$setOnInsert": {"data": Binary(data), "codec": codec, "size": len(raw), "create_time": datetime.now()},
+                        "$set": {"last_used": datetime.now()}
+                    },
+                    upsert=True
+                )
+                output[key] = {"blob": digest, "size": len(raw), "codec": codec}
+        if operations:
+            await self.collection.bulk_write(list(operations.values()), ordered=False)
+        return outputs
+
+    async def resolve(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """将引用替换回原始字符串，一次查询加载全部引用；找不到内容的字段不会出现在结果中"""
+        refs = {key: value for key, value in values.items() if is_ref(value)}
+        if not refs:
+            return dict(values)
+        contents = await self.load([ref['blob'] for ref in refs.values()])
+        output = dict(values)
+        for key, ref in refs.items():
+            if ref['blob'] in contents:
+                output[key] = contents[ref['blob']]
+            else:
+                logger.warning(f"Blob {ref['blob']} referenced by {key} is missing")
+                output.pop(key)
+        return output
+
+    async def load(self, digests: Iterable[str]) -> Dict[str, Optional[str]]:
+        digests: List[str] = list(set(digests))
+        cursor = self.collection.find({"_id": {"$in": digests}})
+        contents = {}
+        async for doc in cursor:
+            contents[doc['_id']] = _decompress(bytes(doc['data']), doc.get('codec', CODEC_ZLIB)).decode('utf-8')
+        return contents
+
+    async def sweep(self, collection, grace_seconds: int) -> int:
+        """
+        清理不再被任何数据引用的内容（标记-清除）
+        - 标记：一次聚合收集主集合中 formForGenerate、result、partial_result 各字段引用的哈希，
+          通过 $merge 写入临时集合，不经过应用进程
+        - 清除：在服务端用 $lookup 找出未被标记且 grace_seconds 内未被使用的内容，分批删除，
+          避免误删刚写入、尚未回写主文档的内容
+        """
+        cutoff = datetime.now() - timedelta(seconds=grace_seconds)
+        marks = self.collection.database.get_collection(f"{self.collection.name}_marks")
+        await marks.drop()
+        refs = [
+            {"$map": {"input": {"$objectToArray": {"$ifNull": [f"${field}", {}]}}, "as": "r", "in": "$$r.v.blob"}}
+            for field in BLOB_FIELDS
+        ]
+        pipeline = [
+            {"$match": {"$or": [{field: {"$exists": True}} for field in BLOB_FIELDS]}},
+            {"$project": {"_id": 0, "refs": {"$concatArrays": refs}}},
+            {"$unwind": "$refs"},
+            {"$match": {"refs": {"$type": "string"}}},
+            {"$group": {"_id": "$refs"}},
+            {"$merge": {"into": marks.name, "whenMatched": "keepExisting", "whenNotMatched": "insert"}},
+        ]
+        deleted = 0
+        try:
+            await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+            unreferenced = self.collection.aggregate([
+                {"$match": {"$or": [
+                    {"last_used": {"$lt": cutoff}},
+                    {"last_used": {"$exists": False}, "create_time": {"$lt": cutoff}},
+                ]}},
+                {"$project": {"_id": 1}},
+                {"$lookup": {"from": marks.name, "localField": "_id", "foreignField": "_id", "as": "mark"}},
+                {"$match": {"mark": {"$size": 0}}},
+                {"$project": {"_id": 1}},
+            ], allowDiskUse=True)
+            batch = []
+            async for doc in unreferenced:
+                batch.append(doc["_id"])
+                if len(batch) >= SWEEP_BATCH_SIZE:
+                    deleted += await self._delete_unreferenced(batch, cutoff)
+                    batch = []
+            if batch:
+                deleted += await self._delete_unreferenced(batch, cutoff)
+        finally:
+            await marks.drop()
+        if deleted:
+            logger.info(f"Removed {deleted} unreferenced blobs")
+        return deleted
+
+    async def _delete_unreferenced(self, digests: List[str], cutoff: datetime) -> int:
+        # 标记后才被引用的内容 last_used 会被刷新，删除时再次校验
+        result = await self.collection.delete_many({
+            "_id": {"$in": digests},
+            "$or": [
+                {"last_used": {"$lt": cutoff}},
+                {"last_used": {"$exists": False}, "create_time": {"$lt": cutoff}},
+            ]
+        })
+        return result.deleted_count
@@ -0,0 +1,145 @@
+import re
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateMany, UpdateOne
+
+# MinHash 签名长度 = BANDS * ROWS，两条标题的 Jaccard 相似度约 0.5 时有 ~90% 概率成为候选
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+SHINGLE_SIZE = 3
+# 候选对的估计相似度达到该值才视为同一话题
+THRESHOLD = 0.5
+# 标题过短时拼接描述的前若干个字符
+SHORT_TITLE = 8
+DESC_PREFIX = 40
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATIONS = [
+    (zlib.crc32(f'a{i}'.encode()) | 1, zlib.crc32(f'b{i}'.encode()))
+    for i in range(NUM_PERM)
+]
+_NOISE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def topic_text(title: Optional[str], desc: Optional[str] = None) -> str:
+    """用于聚类的文本：以标题为主，标题过短时补充描述"""
+    text = _NOISE.sub('', (title or '').lower())
+    if len(text) < SHORT_TITLE and desc:
+        text += _NOISE.sub('', desc.lower())[:DESC_PREFIX]
+    return text
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """字符 n-gram"""
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(tokens: Iterable[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(token.encode('utf-8')) for token in tokens]
+    if not hashes:
+        return ()
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+    """由签名估计 Jaccard 相似度"""
+    if not sig1 or not sig2:
+        return 0.0
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / NUM_PERM
+
+
+class ClusterIndex:
+    """
+    近似重复话题的内存索引（MinHash + LSH）
+    - 每次抓取时用近期数据重建，再增量加入本次抓取的数据
+    - key 为 "source:top_id"，同一条数据重复加入时沿用原有的 cluster_id
+    """
+
+    def __init__(self):
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+        self.clusters: Dict[str, str] = {}
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+        # 本次新分配过成员的话题，需要重新计算聚合热度
+        self.touched: Set[str] = set()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield band, signature[band * ROWS:(band + 1) * ROWS]
+
+    def query(self, signature: Tuple[int, ...]) -> Optional[str]:
+        """返回最相似且超过阈值的数据所在的 cluster_id"""
+        best_key, best_score = None, THRESHOLD
+        seen = set()
+        for bucket in self._bands(signature):
+            for key in self.buckets.get(bucket, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = similarity(signature, self.signatures[key])
+                if score >= best_score:
+                    best_key, best_score = key, score
+        return self.clusters[best_key] if best_key else None
+
+    def add(self, key: str, text: str, cluster_id: Optional[str] = None) -> str:
+        """加入一条数据并返回其 cluster_id；未指定时匹配已有话题或新建"""
+        if key in self.clusters:
+            return self.clusters[key]
+        signature = minhash(shingles(text))
+        if cluster_id is None:
+            cluster_id = (self.query(signature) if signature else None) or uuid.uuid4().hex
+            self.touched.add(cluster_id)
+        self.clusters[key] = cluster_id
+        if signature:
+            self.signatures[key] = signature
+            for bucket in self._bands(signature):
+                self.buckets[bucket].append(key)
+        return cluster_id
+
+
+async def load_cluster_index(collection, window_hours: int) -> ClusterIndex:
+    """用最近 window_hours 小时内的数据重建索引，并为尚未聚类的历史数据补上 cluster_id"""
+    index = ClusterIndex()
+    cursor = collection.find(
+        {"create_time": {"$gte": datetime.now() - timedelta(hours=window_hours)}},
+        {"source": 1, "top_id": 1, "title": 1, "desc": 1, "cluster_id": 1}
+    ).sort("create_time", 1)
+    backfill = []
+    async for doc in cursor:
+        cluster_id = index.add(f"{doc.get('source')}:{doc.get('top_id')}",
+                               topic_text(doc.get('title'), doc.get('desc')), doc.get('cluster_id'))
+        if not doc.get('cluster_id'):
+            backfill.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"cluster_id": cluster_id}}))
+    if backfill:
+        await collection.bulk_write(backfill, ordered=False)
+    return index
+
+
+async def refresh_cluster_stats(collection, cluster_ids: Iterable[str]):
+    """重新计算话题的聚合热度与条数"""
+    cluster_ids = list(set(cluster_ids))
+    if not cluster_ids:
+        return
+    pipeline = [
+        {"$match": {"cluster_id": {"$in": cluster_ids}, "del_flag": False}},
+        {"$group": {"_id": "$cluster_id", "hot": {"$sum": {"$ifNull": ["$hot", 0]}}, "size": {"$sum": 1}}},
+    ]
+    operations = [
+        UpdateMany({"cluster_id": stat["_id"]}, {"$set": {"cluster_hot": stat["hot"], "cluster_size": stat["size"]}})
+        async for stat in collection.aggregate(pipeline)
+    ]
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -14,4 +15,63 @@ class Configuration:
     COLLECTION_NAME: str = os.getenv('COLLECTION_NAME')
     DAILY_HOT_API_BASE_URL: str = os.getenv('DAILY_HOT_API_BASE_URL')
 
-config = Configuration()
\ No newline at end of file
+    # 各进程同时处理的请求/生成任务/抓取请求数，连接池大小据此设置；API 超出时排队等待
+    API_CONCURRENCY: int = int(os.getenv('API_CONCURRENCY', '40'))
+    WORKER_CONCURRENCY: int = int(os.getenv('WORKER_CONCURRENCY', '1'))
+    CRAWLER_CONCURRENCY: int = int(os.getenv('CRAWLER_CONCURRENCY', '8'))
+    MONGODB_TIMEOUT_MS: int = int(os.getenv('MONGODB_TIMEOUT_MS', '5000'))
+
+    # 大模型
+    LLM_MODEL: str = os.getenv('LLM_MODEL', 'glm-4.5-flash')
+    LLM_BASE_URL: str = os.getenv('LLM_BASE_URL', 'https://open.bigmodel.cn/api/paas/v4')
+    # 修复不合格段落使用的模型，未配置时与 LLM_MODEL 相同
+    LLM_REPAIR_MODEL: str | None = os.getenv('LLM_REPAIR_MODEL')
+    # 生成结果校验不通过时，最多修复的轮数
+    POSTPROCESS_MAX_REPAIRS: int = int(os.getenv('POSTPROCESS_MAX_REPAIRS', '1'))
+
+    # 大字段（html、生成结果）分离存储
+    BLOB_STORAGE_ENABLED: bool = os.getenv('BLOB_STORAGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    BLOB_COLLECTION_NAME: str = os.getenv('BLOB_COLLECTION_NAME', f"{os.getenv('COLLECTION_NAME')}_blobs")
+    # 超过该字节数的内容才会分离存储
+    BLOB_MIN_SIZE: int = int(os.getenv('BLOB_MIN_SIZE', '4096'))
+    # 清理无引用内容时，跳过该秒数内被使用过的内容
+    BLOB_SWEEP_GRACE_SECONDS: int = int(os.getenv('BLOB_SWEEP_GRACE_SECONDS', '3600'))
+
+    # 跨数据源话题聚类的时间窗口（小时）
+    CLUSTER_WINDOW_HOURS: int = int(os.getenv('CLUSTER_WINDOW_HOURS', '48'))
+
+    # 生成队列调度
+    GENERATE_SOURCES: str = os.getenv('GENERATE_SOURCES', 'hupu')
+    # 各来源公平调度权重，如 "hupu:3,zhihu:1"，未配置的来源权重为 1
+    SCHEDULER_SOURCE_WEIGHTS: str = os.getenv('SCHEDULER_SOURCE_WEIGHTS', '')
+    # 截止时间在该秒数内的任务优先处理
+    SCHEDULER_DEADLINE_HORIZON: int = int(os.getenv('SCHEDULER_DEADLINE_HORIZON', '600'))
+    # 看板统计的缓存秒数
+    STATS_CACHE_SECONDS: int = int(os.getenv('STATS_CACHE_SECONDS', '5'))
+    # 统计平均生成耗时的时间窗口（小时）
+    STATS_LATENCY_WINDOW_HOURS: int = int(os.getenv('STATS_LATENCY_WINDOW_HOURS', '24'))
+
+    # 停机时等待进行中的生成的最长秒数
+    WORKER_DRAIN_TIMEOUT: int = int(os.getenv('WORKER_DRAIN_TIMEOUT', '60'))
+    # 生成中的数据超过该秒数未完成，视为 worker 已崩溃并重新排队
+    WORKER_LEASE_TIMEOUT: int = int(os.getenv('WORKER_LEASE_TIMEOUT', '1800'))
+    # worker 回收超时租约的间隔秒数
+    WORKER_LEASE_SWEEP_INTERVAL: int = int(os.getenv('WORKER_LEASE_SWEEP_INTERVAL', '60'))
+    # 单条数据最多尝试生成的次数，超过后隔离
+    MAX_GENERATE_ATTEMPTS: int = int(os.getenv('MAX_GENERATE_ATTEMPTS', '3'))
+
+config = Configuration()
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str | None = None):
+    """
+    获取共享的 ChatOpenAI 客户端
+    - 首次调用时才导入 langchain_openai 并创建客户端，避免拖慢启动
+    """
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model or config.LLM_MODEL,
+        base_url=config.LLM_BASE_URL
+    )
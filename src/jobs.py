@@ -0,0 +1,36 @@
+from typing import Dict, Set
+
+# 生成任务状态
+STATUS_NEW = 0         # 待处理
+STATUS_QUEUED = 1      # 排队等待生成
+STATUS_GENERATING = 2  # 生成中
+STATUS_GENERATED = 3   # 已生成
+STATUS_FINISHED = 4    # 已完成
+STATUS_QUARANTINED = 5  # 多次生成失败，已隔离
+
+# 合法的状态流转 0→1→2→3→4，另允许排队中取消 (1→0)
+# 生成失败时重新排队 (2→1) 或隔离 (2→5)，隔离的数据可重新排队 (5→1)
+STATUS_TRANSITIONS: Dict[int, Set[int]] = {
+    STATUS_NEW: {STATUS_QUEUED},
+    STATUS_QUEUED: {STATUS_NEW, STATUS_GENERATING},
+    STATUS_GENERATING: {STATUS_QUEUED, STATUS_GENERATED, STATUS_QUARANTINED},
+    STATUS_GENERATED: {STATUS_FINISHED},
+    STATUS_FINISHED: set(),
+    STATUS_QUARANTINED: {STATUS_QUEUED},
+}
+
+# 允许通过 API 发起的状态流转；1→2、2→* 只能由 worker 在领取/回写时完成
+API_TRANSITIONS: Dict[int, Set[int]] = {
+    STATUS_NEW: {STATUS_QUEUED},
+    STATUS_QUEUED: {STATUS_NEW},
+    STATUS_GENERATED: {STATUS_FINISHED},
+    STATUS_QUARANTINED: {STATUS_QUEUED},
+}
+
+# 默认生成的目标平台（与 src/templates 中的模板 key 对应）
+DEFAULT_TARGETS = ['kuaishou', 'red', 'bilibili', 'douyin']
+
+
+def can_transition(current: int, target: int, transitions: Dict[int, Set[int]] = STATUS_TRANSITIONS) -> bool:
+    """判断状态流转是否合法"""
+    return target in transitions.get(current, set())
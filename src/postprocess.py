@@ -0,0 +1,174 @@
+import asyncio
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.config import config, get_chat_model
+from src.log import logger
+
+# 各平台输出的段落要求，与 src/templates/hupu.py 中的输出格式保持一致
+# - sections: 段落顺序；required: 必须出现且非空的段落
+# - max_length: 段落最大字数；tags: 标签数量范围 (最少, 最多)
+PLATFORM_RULES: Dict[str, Dict] = {
+    'kuaishou': {
+        'sections': ['标题', '描述', '标签', '附件列表'],
+        'required': ['标题', '描述', '标签'],
+        'max_length': {'标题': 15},
+        'tags': (1, 4),
+    },
+    'red': {
+        'sections': ['标题', '正文', '标签', '附件列表'],
+        'required': ['标题', '正文', '标签'],
+        'max_length': {},
+        'tags': (5, 8),
+    },
+    'bilibili': {
+        'sections': ['标题', '简介', '标签', '分区', '附件列表'],
+        'required': ['标题', '简介', '标签', '分区'],
+        'max_length': {},
+        'tags': (5, 10),
+    },
+    'douyin': {
+        'sections': ['描述', '标签', '附件列表'],
+        'required': ['描述', '标签'],
+        'max_length': {'描述': 15},
+        'tags': (3, 5),
+    },
+}
+
+TAG_SECTION = '标签'
+_SECTION = re.compile(r'【([^【】\n]{1,10})】')
+_TAG_SPLIT = re.compile(r'[\s,，、;；#]+')
+_BULLET = re.compile(r'^\s*(?:[-*•]|\d+[.、])\s*', re.MULTILINE)
+
+
+class ParsedContent(BaseModel):
+    sections: Dict[str, str] = {}
+    tags: List[str] = []
+    issues: List[str] = []
+
+
+def parse_tags(text: str) -> List[str]:
+    tags = []
+    for token in _TAG_SPLIT.split(_BULLET.sub(' ', text)):
+        if token and token not in tags:
+            tags.append(token)
+    return tags
+
+
+@lru_cache(maxsize=None)
+def section_pattern(names: Tuple[str, ...]) -> re.Pattern:
+    """只匹配给定段落名的【段落名】，正文中其他带括号的文字不会被当作段落"""
+    return re.compile('【(' + '|'.join(re.escape(name) for name in names) + ')】')
+
+
+def parse_sections(content: str, names: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    按【段落名】切分输出，段落名之前的多余文字丢弃
+    - 指定 names 时只在这些段落名处切分；未指定时（未知平台）按任意【...】切分
+    """
+    pattern = section_pattern(tuple(names)) if names else _SECTION
+    sections = {}
+    matches = list(pattern.finditer(content))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(content)
+        sections[match.group(1).strip()] = content[match.end():end].strip()
+    return sections
+
+
+def check_section(name: str, text: str, rules: Dict) -> Optional[str]:
+    """校验单个段落，返回问题描述；没有问题时返回 None"""
+    if name in rules['required'] and not text:
+        return f"缺少【{name}】"
+    max_length = rules['max_length'].get(name)
+    if max_length and len(re.sub(r'\s', '', text)) > max_length:
+        return f"【{name}】超过{max_length}字"
+    if name == TAG_SECTION and text:
+        low, high = rules['tags']
+        count = len(parse_tags(text))
+        if not low <= count <= high:
+            return f"【{name}】需要{low}-{high}个标签，当前{count}个"
+    return None
+
+
+def parse_content(to_key: str, content: str) -> ParsedContent:
+    """将生成结果解析为结构化段落并校验平台约束，未知平台只做切分"""
+    rules = PLATFORM_RULES.get(to_key)
+    sections = parse_sections(content, rules['sections'] if rules else None)
+    if rules is None:
+        return ParsedContent(sections=sections, tags=parse_tags(sections.get(TAG_SECTION, '')))
+    issues = [
+        issue for issue in (check_section(name, sections.get(name, ''), rules) for name in rules['sections'])
+        if issue
+    ]
+    return ParsedContent(sections=sections, tags=parse_tags(sections.get(TAG_SECTION, '')), issues=issues)
+
+
+def render_content(to_key: str, sections: Dict[str, str]) -> str:
+    """按平台段落顺序重新拼接为文本"""
+    order = PLATFORM_RULES.get(to_key, {}).get('sections', [])
+    names = [name for name in order if name in sections] + [name for name in sections if name not in order]
+    return '\n\n'.join(f"【{name}】\n{sections[name]}" for name in names)
+
+
+async def repair_section(to_key: str, name: str, text: str, issue: str, context: str) -> str:
+    """只针对不合格的段落重新生成（仅用于 PLATFORM_RULES 中的平台）"""
+    messages = [
+        ('system', f'你是{to_key}平台的内容编辑。请修改给定的【{name}】段落使其满足要求，'
+                   f'只输出修改后的段落内容，不要输出段落名和其他说明。'),
+        ('human', f'问题：{issue}\n\n参考内容：\n{context[:1000]}\n\n原【{name}】：\n{text}'),
+    ]
+    response = await get_chat_model(config.LLM_REPAIR_MODEL).ainvoke(messages)
+    repaired = str(response.content).strip()
+    # 模型有时仍会带上段落名，只去掉该平台的段落名，保留正文中的其他【...】
+    return section_pattern(tuple(PLATFORM_RULES[to_key]['sections'])).sub('', repaired).strip()
+
+
+async def postprocess(to_key: str, content: str) -> Tuple[str, ParsedContent]:
+    """
+    解析并校验生成结果，对不合格的段落做低成本修复
+    - 每轮只重新生成不合格的段落，最多 POSTPROCESS_MAX_REPAIRS 轮
+    - 返回整理后的文本与结构化结果（仍不合格的问题保留在 issues 中）
+    - 修复只是尽力而为：调用失败时保留原段落并记入 issues，不影响已生成的内容
+    - 没有做任何修复时原样返回生成结果
+    """
+    parsed = parse_content(to_key, content)
+    rules = PLATFORM_RULES.get(to_key)
+    if rules is None or not parsed.sections:
+        # 未按格式输出时无法定位段落，保留原文交给编辑处理
+        if rules is not None:
+            parsed.issues = ["未按格式输出"]
+        return content, parsed
+
+    sections = dict(parsed.sections)
+    repaired_any = False
+    # 修复调用失败的段落不再重试
+    errors: Dict[str, str] = {}
+    for _ in range(config.POSTPROCESS_MAX_REPAIRS):
+        failing = [
+            (name, issue) for name in rules['sections']
+            if name not in errors and (issue := check_section(name, sections.get(name, ''), rules))
+        ]
+        if not failing:
+            break
+        logger.debug(f"Repairing {to_key}: {[issue for _, issue in failing]}")
+        context = render_content(to_key, sections)
+        repaired = await asyncio.gather(
+            *[repair_section(to_key, name, sections.get(name, ''), issue, context) for name, issue in failing],
+            return_exceptions=True
+        )
+        for (name, _), text in zip(failing, repaired):
+            if isinstance(text, Exception):
+                logger.warning(f"Failed to repair {to_key}【{name}】: {text}")
+                errors[name] = f"【{name}】修复失败：{type(text).__name__}"
+                continue
+            sections[name] = text
+            repaired_any = True
+
+    if repaired_any:
+        content = render_content(to_key, sections)
+        parsed = parse_content(to_key, content)
+    parsed.issues += list(errors.values())
+    return content, parsed
@@ -0,0 +1,168 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.read_concern import ReadConcern
+
+from src.config import config, get_chat_model
+from src.log import logger
+
+try:
+    import zstandard  # noqa: F401
+    COMPRESSORS = 'zstd,zlib'
+except ImportError:
+    COMPRESSORS = 'zlib'
+
+# 各类进程的连接参数，concurrency 为进程实际同时处理的请求/任务数
+# - api: 并发请求多，读写都要求较快失败，列表读取允许读到本地最新数据
+# - worker: 领取/回写使用 majority 读写确认，避免主从切换后读到被回滚的状态而重复生成
+# - crawler: 批量写入，允许较长的 socket 超时
+WORKLOADS: Dict[str, Dict[str, Any]] = {
+    'api': {
+        'concurrency': config.API_CONCURRENCY,
+        'min_pool_size': 2,
+        'socket_timeout_ms': 10000,
+        'write_concern': WriteConcern(w=1),
+        'read_concern': ReadConcern('local'),
+    },
+    'worker': {
+        'concurrency': config.WORKER_CONCURRENCY,
+        'min_pool_size': 1,
+        'socket_timeout_ms': 30000,
+        'write_concern': WriteConcern(w='majority'),
+        'read_concern': ReadConcern('majority'),
+    },
+    'crawler': {
+        'concurrency': config.CRAWLER_CONCURRENCY,
+        'min_pool_size': 0,
+        'socket_timeout_ms': 30000,
+        'write_concern': WriteConcern(w=1),
+        'read_concern': ReadConcern('local'),
+    },
+}
+
+
+class Resources:
+    """
+    进程级共享资源：MongoDB 连接池、aiohttp 会话、大模型客户端
+    - 连接池大小跟随进程的实际并发度，limit() 保证同时进行的工作不超过该并发度
+    - 所有客户端延迟创建，close() 时统一释放
+    """
+
+    def __init__(self, workload: str):
+        if workload not in WORKLOADS:
+            raise ValueError(f"Unknown workload: {workload}")
+        self.workload = workload
+        self.options = WORKLOADS[workload]
+        self._mongo: Optional[AsyncIOMotorClient] = None
+        self._http = None
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def __aenter__(self) -> 'Resources':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.options['concurrency'], 1)
+
+    @property
+    def mongo(self) -> AsyncIOMotorClient:
+        if self._mongo is None:
+            # 额外保留 2 个连接给索引维护、健康检查等后台操作
+            self._mongo = AsyncIOMotorClient(
+                config.MONGODB_URL,
+                maxPoolSize=self.concurrency + 2,
+                minPoolSize=self.options['min_pool_size'],
+                maxIdleTimeMS=60000,
+                serverSelectionTimeoutMS=config.MONGODB_TIMEOUT_MS,
+                connectTimeoutMS=config.MONGODB_TIMEOUT_MS,
+                waitQueueTimeoutMS=config.MONGODB_TIMEOUT_MS,
+                socketTimeoutMS=self.options['socket_timeout_ms'],
+                compressors=COMPRESSORS,
+                appname=f"ornnforge-{self.workload}",
+            )
+            logger.info(f"MongoDB client created for {self.workload} (maxPoolSize={self.concurrency + 2})")
+        return self._mongo
+
+    @property
+    def db(self):
+        return self.mongo.get_database(
+            config.DATABASE_NAME,
+            write_concern=self.options['write_concern'],
+            read_concern=self.options['read_concern']
+        )
+
+    def collection(self, name: Optional[str] = None):
+        return self.db.get_collection(name or config.COLLECTION_NAME)
+
+    async def http(self):
+        """获取共享的 aiohttp 会话，连接数与并发度一致"""
+        if self._http is None or self._http.closed:
+            import aiohttp
+
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30, connect=10)
+            )
+        return self._http
+
+    @staticmethod
+    def chat(model: Optional[str] = None):
+        return get_chat_model(model)
+
+    async def health(self) -> Dict[str, Any]:
+        """检查各客户端状态"""
+        try:
+            await asyncio.wait_for(self.mongo.admin.command('ping'), timeout=config.MONGODB_TIMEOUT_MS / 1000)
+            mongo_ok = True
+        except Exception as e:
+            logger.warning(f"MongoDB health check failed: {e}")
+            mongo_ok = False
+        return {
+            "mongodb": mongo_ok,
+            "http": self._http is not None and not self._http.closed,
+            "inflight": self._inflight,
+        }
+
+    @asynccontextmanager
+    async def track(self):
+        """标记一段正在进行的工作，close() 会等待其结束"""
+        self._inflight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.set()
+
+    @asynccontextmanager
+    async def limit(self):
+        """占用一个并发槽位并标记为进行中的工作，槽位用尽时等待"""
+        async with self._slots:
+            async with self.track():
+                yield
+
+    async def close(self, drain_timeout: float = 10):
+        """等待进行中的工作结束后释放所有客户端"""
+        if self._inflight:
+            logger.info(f"Draining {self._inflight} in-flight tasks ({self.workload})")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Drain timed out with {self._inflight} tasks in flight ({self.workload})")
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+            self._http = None
+        if self._mongo is not None:
+            self._mongo.close()
+            self._mongo = None
+            logger.info(f"MongoDB connection closed ({self.workload})")
@@ -0,0 +1,162 @@
+import math
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+
+from pymongo import ReturnDocument
+
+from src.config import config
+from src.jobs import STATUS_GENERATING, STATUS_QUARANTINED, STATUS_QUEUED
+from src.log import logger
+
+# 热度每增加 10 倍加 1 分；创建时间每晚 RECENCY_HOURS_PER_POINT 小时加 1 分
+# 新鲜度折算为与当前时间无关的绝对分数，两条数据的先后只取决于自身属性，排队期间无需重新计算
+RECENCY_HOURS_PER_POINT = 4.0
+# 与 pymongo 对 naive datetime 的处理一致（按原样存储），不做时区换算
+EPOCH = datetime(1970, 1, 1)
+# 旧版本按入队时刻计算的优先级都小于该值，启动时据此识别并重新计算
+LEGACY_PRIORITY_CEILING = 1000
+
+
+def compute_priority(hot: Optional[int], create_time: Optional[datetime], boost: float = 0,
+                     now: Optional[datetime] = None) -> float:
+    """根据热度、创建时间和人工加权计算排队优先级（越大越先处理），没有创建时间时按当前时间计"""
+    created = create_time or now or datetime.now()
+    priority = math.log10(max(hot or 0, 0) + 1)
+    priority += (created - EPOCH).total_seconds() / 3600 / RECENCY_HOURS_PER_POINT
+    return round(priority + (boost or 0), 4)
+
+
+def priority_expression(boost: Any = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    compute_priority 的聚合表达式版本，用于管道更新，在服务端读取 hot、create_time 计算
+    - boost 为 None 时沿用文档中已有的 boost
+    """
+    boost = {"$ifNull": ["$boost", 0]} if boost is None else boost
+    created = {"$ifNull": ["$create_time", now or datetime.now()]}
+    return {"$round": [{"$add": [
+        {"$log10": {"$add": [{"$max": [{"$ifNull": ["$hot", 0]}, 0]}, 1]}},
+        {"$divide": [{"$subtract": [created, EPOCH]}, 3600 * 1000 * RECENCY_HOURS_PER_POINT]},
+        boost,
+    ]}, 4]}
+
+
+def lease_time() -> datetime:
+    """当前时间截断到毫秒，与 MongoDB 中保存的时间精度一致，可直接作为查询条件比较（如 claimed_at）"""
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def parse_weights(raw: str) -> Dict[str, float]:
+    """解析 "hupu:3,zhihu:1" 格式的权重配置"""
+    weights = {}
+    for part in raw.split(','):
+        name, _, weight = part.partition(':')
+        if name.strip() and weight.strip():
+            weights[name.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+async def ensure_indexes(collection):
+    """创建调度查询所需的索引（幂等操作）"""
+    await collection.create_index(
+        [("status", 1), ("del_flag", 1), ("source", 1), ("priority", -1)],
+        name="status_1_del_flag_1_source_1_priority_-1"
+    )
+    await collection.create_index(
+        [("status", 1), ("del_flag", 1), ("deadline", 1)],
+        name="status_1_del_flag_1_deadline_1"
+    )
+
+
+async def migrate_priorities(collection) -> int:
+    """将旧版本（随入队时刻变化）的优先级换算为当前的绝对分数，幂等操作"""
+    result = await collection.update_many(
+        {"status": {"$in": [STATUS_QUEUED, STATUS_GENERATING]}, "priority": {"$lt": LEGACY_PRIORITY_CEILING}},
+        [{"$set": {"priority": priority_expression()}}]
+    )
+    if result.modified_count:
+        logger.info(f"Recomputed {result.modified_count} legacy priorities")
+    return result.modified_count
+
+
+class Scheduler:
+    """
+    生成队列调度器
+    - 截止时间临近的任务优先
+    - 其余任务按来源做加权公平调度（stride scheduling），来源内按 priority 降序
+    """
+
+    def __init__(self, sources: List[str], weights: Optional[Dict[str, float]] = None,
+                 deadline_horizon: int = 600):
+        weights = weights or {}
+        self.sources = sources
+        self.weights = {source: weights.get(source, 1.0) for source in sources}
+        self.passes = {source: 0.0 for source in sources}
+        self.deadline_horizon = timedelta(seconds=deadline_horizon)
+
+    @classmethod
+    def from_config(cls) -> 'Scheduler':
+        sources = [s.strip() for s in config.GENERATE_SOURCES.split(',') if s.strip()]
+        return cls(sources, parse_weights(config.SCHEDULER_SOURCE_WEIGHTS), config.SCHEDULER_DEADLINE_HORIZON)
+
+    async def _claim(self, collection, query: Dict[str, Any], sort: List) -> Optional[Dict[str, Any]]:
+        # 原子地将 1 置为 2，多个 worker 副本不会领取到同一条数据
+        # 领取时即计入尝试次数，进程在生成中途崩溃也会被统计
+        return await collection.find_one_and_update(
+            {**query, "status": STATUS_QUEUED, "del_flag": False},
+            {"$set": {"status": STATUS_GENERATING, "claimed_at": lease_time()}, "$inc": {"attempts": 1}},
+            sort=sort,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def release_expired(self, collection, lease_timeout: int, max_attempts: int) -> int:
+        """
+        将领取超时仍在生成中的数据重新排队，尝试次数已达上限的直接隔离
+        - 没有 claimed_at 的（旧数据或未经 worker 领取）同样视为超时
+        """
+        expired = {"status": STATUS_GENERATING, "$or": [
+            {"claimed_at": {"$lt": datetime.now() - timedelta(seconds=lease_timeout)}},
+            {"claimed_at": {"$exists": False}},
+        ]}
+        quarantined = await collection.update_many(
+            {**expired, "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": STATUS_QUARANTINED, "last_error": "Lease expired", "last_failed_at": datetime.now()}}
+        )
+        requeued = await collection.update_many(
+            expired,
+            {"$set": {"status": STATUS_QUEUED}, "$unset": {"claimed_at": ""}}
+        )
+        if quarantined.modified_count or requeued.modified_count:
+            logger.warning(f"Expired leases: requeued {requeued.modified_count}, quarantined {quarantined.modified_count}")
+        return quarantined.modified_count + requeued.modified_count
+
+    async def claim(self, collection) -> Optional[Dict[str, Any]]:
+        """领取下一条待生成数据，没有可领取的数据时返回 None"""
+        item = await self._claim(
+            collection,
+            {"source": {"$in": self.sources}, "deadline": {"$lte": datetime.now() + self.deadline_horizon}},
+            [("deadline", 1)]
+        )
+        if item:
+            self._charge(item.get("source"))
+            return item
+
+        idle = []
+        for source in sorted(self.sources, key=lambda s: self.passes[s]):
+            item = await self._claim(collection, {"source": source}, [("priority", -1)])
+            if item:
+                # 空闲的来源不积累优势，恢复后与当前来源同起点竞争
+                for key in idle:
+                    self.passes[key] = max(self.passes[key], self.passes[source])
+                self._charge(source)
+                return item
+            idle.append(source)
+        return None
+
+    def _charge(self, source: Optional[str]):
+        if source not in self.passes:
+            return
+        self.passes[source] += 1 / self.weights[source]
+        floor = min(self.passes.values())
+        for key in self.passes:
+            self.passes[key] -= floor
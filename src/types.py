@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List, Optional, Union, Annotated, Any
+from typing import Dict, List, Optional, Union, Annotated, Any
 from bson import ObjectId
-from pydantic import BaseModel, Field, BeforeValidator
+from pydantic import AfterValidator, BaseModel, Field, BeforeValidator, TypeAdapter
 
 
 # 定义 ObjectId 转换函数
@@ -24,6 +24,14 @@ def parse_datetime(v: datetime) -> str:
 
 DateTimeField = Annotated[str, BeforeValidator(parse_datetime)]
 
+def to_local_naive(v: datetime) -> datetime:
+    # 与 create_time / claimed_at 一致，统一存储为本地时间且不带时区
+    if v.tzinfo is not None:
+        return v.astimezone().replace(tzinfo=None)
+    return v
+
+LocalDateTime = Annotated[datetime, AfterValidator(to_local_naive)]
+
 
 class FormForCreationGenerate(BaseModel):
     html: str
@@ -34,6 +42,9 @@ class FormForCreationGenerate(BaseModel):
 class ResultForCreationGenerate(BaseModel):
     to: str
     content: str
+    sections: Dict[str, str] = {}
+    tags: List[str] = []
+    issues: List[str] = []
 
 class CreationItem(BaseModel):
     _id: str
@@ -52,6 +63,10 @@ class CreationItem(BaseModel):
     result: dict = {}
     del_flag: bool = False
     create_time: datetime
+    cluster_id: Union[str, None] = None
+
+# 整批校验抓取数据
+CreationItemList = TypeAdapter(List[CreationItem])
 
 class CreationRowInfo(BaseModel):
     id: ObjectIdStr = Field(..., alias="_id")
@@ -65,6 +80,11 @@ class CreationRowInfo(BaseModel):
     url: Optional[str] = None
     create_time: DateTimeField
     status: Optional[int] = 0
+    cluster_id: Optional[str] = None
+    cluster_hot: Optional[int] = None
+    cluster_size: Optional[int] = None
+    attempts: Optional[int] = None
+    last_error: Optional[str] = None
 
 class CreationData(BaseModel):
     items: List[CreationRowInfo]
@@ -105,9 +125,30 @@ class CreationDataResponse(BaseModel):
     data: Union[CreationData | CreationDetailInfo | CreationGenerateForm]
 
 
+class StatusSourceCount(BaseModel):
+    status: int
+    source: str
+    count: int
+
+class CreationStats(BaseModel):
+    counts: List[StatusSourceCount] = []
+    queue_depth: int = 0
+    generating: int = 0
+    avg_generate_seconds: Optional[float] = None
+    oldest_pending_seconds: Optional[float] = None
+    updated_at: DateTimeField
+
+class CreationStatsResponse(BaseModel):
+    code: int
+    message: str
+    data: CreationStats
+
+
 class CreationGenerateFormUpdateRequest(BaseModel):
     id: str
     form: FormForCreationGenerate
+    boost: Optional[float] = None
+    deadline: Optional[LocalDateTime] = None
 
 class OnlyIdRequest(BaseModel):
     id: str
@@ -117,4 +158,21 @@ class StatusUpdateRequest(BaseModel):
     status: str
 
 class IdsUpdateRequest(BaseModel):
-    ids: List[str]
\ No newline at end of file
+    ids: List[str]
+
+class JobControlItem(BaseModel):
+    id: str
+    status: int
+    form: Optional[FormForCreationGenerate] = None
+    targets: Optional[List[str]] = None
+    boost: Optional[float] = None
+    deadline: Optional[LocalDateTime] = None
+
+class JobControlRequest(BaseModel):
+    items: List[JobControlItem] = Field(..., min_length=1, max_length=500)
+
+class JobControlResult(BaseModel):
+    id: str
+    ok: bool
+    status: Optional[int] = None
+    message: str = "OK"
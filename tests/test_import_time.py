@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# 入口模块依赖的三方库缺失时无法测量
+for module in ("motor", "pydantic", "aiohttp", "loguru", "dotenv"):
+    pytest.importorskip(module)
+
+ROOT = Path(__file__).resolve().parent.parent
+# 冷启动导入耗时上限（秒），CI 机器较慢时可通过环境变量放宽
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.0"))
+HEAVY_MODULES = ("langchain_core", "langchain_openai", "openai")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure_import(module: str) -> dict:
+    # 每次都在新进程中导入，避免被当前进程已加载的模块影响
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", ["main", "batch1"])
+def test_entry_point_import_budget(module):
+    result = measure_import(module)
+    assert result["elapsed"] < IMPORT_BUDGET_SECONDS, (
+        f"importing {module} took {result['elapsed']:.3f}s (budget {IMPORT_BUDGET_SECONDS}s)"
+    )
+
+
+@pytest.mark.parametrize("module", ["main", "batch1"])
+def test_entry_point_defers_llm_imports(module):
+    loaded = set(measure_import(module)["modules"])
+    assert not loaded & set(HEAVY_MODULES), f"{module} imports {sorted(loaded & set(HEAVY_MODULES))} at startup"
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+for module in ("pydantic", "loguru", "dotenv"):
+    pytest.importorskip(module)
+
+from src import postprocess as postprocess_module
+from src.postprocess import PLATFORM_RULES, check_section, parse_content, parse_sections, parse_tags
+
+KUAISHOU = PLATFORM_RULES['kuaishou']
+RED_SECTIONS = PLATFORM_RULES['red']['sections']
+
+
+def test_parse_sections_drops_preamble():
+    content = "好的，以下是内容：\n【标题】\n湖人绝杀\n\n【描述】\n詹姆斯压哨三分"
+    assert parse_sections(content, KUAISHOU['sections']) == {'标题': '湖人绝杀', '描述': '詹姆斯压哨三分'}
+
+
+def test_parse_sections_keeps_brackets_inside_body():
+    content = "【标题】\n今日速递\n\n【正文】\n【重磅】湖人官宣交易\n细节如下\n\n【标签】\n#NBA #湖人"
+    sections = parse_sections(content, RED_SECTIONS)
+    assert sections['正文'] == "【重磅】湖人官宣交易\n细节如下"
+    assert '重磅' not in sections
+
+
+def test_parse_sections_without_names_splits_on_any_header():
+    assert parse_sections("【甲】\n1\n【乙】\n2") == {'甲': '1', '乙': '2'}
+
+
+def test_parse_tags_strips_markers_and_duplicates():
+    assert parse_tags("#NBA #湖人, 湖人、詹姆斯\n- 篮球") == ['NBA', '湖人', '詹姆斯', '篮球']
+
+
+def test_check_section_missing_required():
+    assert check_section('标题', '', KUAISHOU) == "缺少【标题】"
+    # 非必需段落可以为空
+    assert check_section('附件列表', '', KUAISHOU) is None
+
+
+def test_check_section_kuaishou_title_length():
+    assert check_section('标题', '一' * 15, KUAISHOU) is None
+    # 空白不计入字数
+    assert check_section('标题', '一' * 10 + ' ' * 6 + '一' * 5, KUAISHOU) is None
+    assert check_section('标题', '一' * 16, KUAISHOU) == "【标题】超过15字"
+
+
+@pytest.mark.parametrize("tags, ok", [
+    ("#a", True),
+    ("#a #b #c #d", True),
+    ("#a #b #c #d #e", False),
+])
+def test_check_section_tag_count(tags, ok):
+    issue = check_section('标签', tags, KUAISHOU)
+    assert (issue is None) is ok
+    if not ok:
+        assert issue == "【标签】需要1-4个标签，当前5个"
+
+
+def test_parse_content_reports_missing_sections():
+    parsed = parse_content('kuaishou', "【标题】\n湖人绝杀\n\n【标签】\n#NBA")
+    assert parsed.issues == ["缺少【描述】"]
+    assert parsed.tags == ['NBA']
+
+
+def test_parse_content_unknown_platform_only_splits():
+    parsed = parse_content('weibo', "【标题】\n湖人绝杀")
+    assert parsed.sections == {'标题': '湖人绝杀'}
+    assert parsed.issues == []
+
+
+def test_postprocess_keeps_content_when_repair_fails(monkeypatch):
+    async def failing_repair(*args):
+        raise TimeoutError("rate limited")
+
+    monkeypatch.setattr(postprocess_module, 'repair_section', failing_repair)
+    content = "【标题】\n" + '一' * 20 + "\n\n【描述】\n詹姆斯压哨三分\n\n【标签】\n#NBA"
+    result, parsed = asyncio.run(postprocess_module.postprocess('kuaishou', content))
+    assert result == content
+    assert parsed.issues == ["【标题】超过15字", "【标题】修复失败：TimeoutError"]
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+for module in ("pymongo", "loguru", "dotenv"):
+    pytest.importorskip(module)
+
+from src.scheduler import RECENCY_HOURS_PER_POINT, compute_priority, parse_weights
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def test_priority_does_not_depend_on_when_it_is_computed():
+    created = NOW - timedelta(hours=3)
+    assert compute_priority(500, created, now=NOW) == compute_priority(500, created, now=NOW + timedelta(days=2))
+
+
+def test_fresh_item_outranks_stale_backlog_with_same_hot():
+    stale = compute_priority(1000, NOW - timedelta(hours=24), now=NOW - timedelta(hours=24))
+    fresh = compute_priority(1000, NOW, now=NOW)
+    assert fresh > stale
+
+
+def test_hot_and_recency_trade_off():
+    # 热度高 10 倍抵得上新 RECENCY_HOURS_PER_POINT 小时
+    older_hotter = compute_priority(9999, NOW - timedelta(hours=RECENCY_HOURS_PER_POINT))
+    newer = compute_priority(999, NOW)
+    assert older_hotter == pytest.approx(newer, abs=1e-3)
+
+
+def test_boost_and_missing_create_time():
+    assert compute_priority(0, NOW, boost=2) == pytest.approx(compute_priority(0, NOW) + 2)
+    assert compute_priority(0, None, now=NOW) == compute_priority(0, NOW)
+
+
+def test_parse_weights_ignores_malformed_parts():
+    assert parse_weights("hupu:3, zhihu:1,weibo,:2") == {'hupu': 3.0, 'zhihu': 1.0}